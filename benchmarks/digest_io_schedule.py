@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# Cold-cache hashing throughput of Digester for each I/O schedule.
+# The "sorted" row is the baseline: the original read loop in sorted path order.
+#
+# usage: python benchmarks/digest_io_schedule.py <PATH/TO/REPO> [--repeat N] [--drop-caches]
+#
+# The collection must be installed (or on the python path as ansible_collections.playbook.integrity).
+# Before each run, the page cache of the target files is evicted with POSIX_FADV_DONTNEED.
+# With --drop-caches (root only), /proc/sys/vm/drop_caches is also used to evict the dentry/inode caches.
+import os
+import sys
+import time
+import argparse
+import ansible_collections.playbook.integrity.plugins.module_utils.common as common
+
+
+def evict(path, fname_list, drop_caches=False):
+    for fname in fname_list:
+        with open(os.path.join(path, fname), "rb") as file:
+            common.fadvise(file, "POSIX_FADV_DONTNEED")
+    if drop_caches:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+
+
+def run(path, io_schedule, repeat, drop_caches):
+    digester = common.Digester(path, io_schedule=io_schedule)
+    fname_list = digester.list_files_git(repo_path=path)
+    total_bytes = sum(os.path.getsize(os.path.join(path, fname)) for fname in fname_list)
+    elapsed = []
+    for _ in range(repeat):
+        evict(path, fname_list, drop_caches)
+        start = time.perf_counter()
+        digester.calc_digest_for_fname_list(path, fname_list)
+        elapsed.append(time.perf_counter() - start)
+    best = min(elapsed)
+    return len(fname_list), total_bytes, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cold-cache hashing throughput for each I/O schedule")
+    parser.add_argument("path")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--drop-caches", action="store_true")
+    args = parser.parse_args()
+
+    if not hasattr(os, "posix_fadvise") and not args.drop_caches:
+        print("warning: posix_fadvise is not available, so the page cache is not evicted", file=sys.stderr)
+
+    print("{:<8} {:>8} {:>12} {:>10} {:>10}".format("schedule", "files", "bytes", "seconds", "MB/s"))
+    for io_schedule in common.IO_SCHEDULES:
+        num_files, total_bytes, best = run(args.path, io_schedule, args.repeat, args.drop_caches)
+        throughput = total_bytes / best / 1024 / 1024 if best > 0 else 0
+        print("{:<8} {:>8} {:>12} {:>10.3f} {:>10.1f}".format(io_schedule, num_files, total_bytes, best, throughput))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,12 @@ import platform
 import subprocess
 import git
 import hashlib
+import struct
+import collections
+import json
+import shutil
+import tarfile
+import tempfile
 import traceback
 
 TYPE_PLAYBOOK = "playbook"
@@ -22,9 +28,84 @@ SIGNATURE_FILENAME_SIGSTORE = "sha256sum.txt.sig"
 
 BLOCKSIZE = 65536
 
+BUNDLE_MODE = "w:gz"
+BUNDLE_STREAM_MODE = "r|*"
+
+IO_SCHEDULE_SORTED = "sorted"
+IO_SCHEDULE_INODE = "inode"
+IO_SCHEDULE_EXTENT = "extent"
+IO_SCHEDULES = [IO_SCHEDULE_SORTED, IO_SCHEDULE_INODE, IO_SCHEDULE_EXTENT]
+
+DEFAULT_PREFETCH = 4
+
+# ioctl request number and struct layout of FS_IOC_FIEMAP (linux/fiemap.h)
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER_FORMAT = "=QQIIII"
+FIEMAP_EXTENT_FORMAT = "=QQQQQIIII"
+FIEMAP_EXTENT_UNKNOWN = 0x00000002
+FIEMAP_EXTENT_DELALLOC = 0x00000004
+FIEMAP_EXTENT_DATA_INLINE = 0x00000200
+
+DEFAULT_REPORT_LIMIT = 20
+
+MISMATCH_ADDED = "added"
+MISMATCH_REMOVED = "removed"
+MISMATCH_CHANGED = "changed"
+
+
+class MismatchReport:
+    # keeps only counts and the first `limit` paths per category in memory.
+    # all the paths are streamed to `report_file` as JSON lines if specified.
+    def __init__(self, limit=DEFAULT_REPORT_LIMIT, report_file=""):
+        self.limit = limit
+        self.report_file = report_file
+        self.counts = {}
+        self.paths = {}
+        self.file = None
+        if report_file != "":
+            self.file = open(report_file, "w")
+
+    def add(self, category, fname):
+        self.counts[category] = self.counts.get(category, 0) + 1
+        paths = self.paths.setdefault(category, [])
+        if len(paths) < self.limit:
+            paths.append(fname)
+        if self.file is not None:
+            self.file.write(json.dumps({"category": category, "path": fname}) + "\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def count(self, category=None):
+        if category is None:
+            return sum(self.counts.values())
+        return self.counts.get(category, 0)
+
+    def summary(self, category):
+        num = self.count(category)
+        paths = self.paths.get(category, [])
+        if num > len(paths):
+            return "{} (and {} more)".format(paths, num - len(paths))
+        return "{}".format(paths)
+
+    def to_dict(self):
+        result = {"counts": dict(self.counts), "paths": dict(self.paths), "limit": self.limit}
+        if self.report_file != "":
+            result["report_file"] = self.report_file
+        return result
+
+
 class Digester:
-    def __init__(self, path):
+    def __init__(self, path, report_limit=DEFAULT_REPORT_LIMIT, report_file="", io_schedule=IO_SCHEDULE_SORTED, prefetch=DEFAULT_PREFETCH):
         self.path = path
+        self.report_limit = report_limit
+        self.report_file = report_file
+        if io_schedule not in IO_SCHEDULES:
+            raise ValueError("io_schedule must be one of {}".format(IO_SCHEDULES))
+        self.io_schedule = io_schedule
+        self.prefetch = prefetch
         if path.startswith("~/"):
             self.path = os.path.expanduser(path)
         self.type = self.get_scm_type(path)
@@ -46,12 +127,18 @@ class Digester:
     def check(self, path=""):
         if path == "":
             path = self.path
+        self.reset_report_file()
         result = self.filename_check(path)
         if result["returncode"] != 0:
             return result
         result = self.digest_check(path)
         return result
 
+    def reset_report_file(self):
+        # the report file is written only when a mismatch is found, so clear the one of a previous run
+        if self.report_file != "":
+            open(self.report_file, "w").close()
+
     def filename_check(self, path):
         digest_file = os.path.join(path, DIGEST_FILENAME)
         if not os.path.exists(digest_file):
@@ -63,11 +150,18 @@ class Digester:
         current_fname_list = self.list_files_git(path, DIGEST_FILENAME)
         current_fnames = set(current_fname_list)
         if signed_fnames != current_fnames:
-            added = current_fnames - signed_fnames if len(current_fnames - signed_fnames) > 0 else None
-            removed = signed_fnames - current_fnames if len(signed_fnames - current_fnames) > 0 else None
+            report = MismatchReport(self.report_limit, self.report_file)
+            try:
+                for fname in sorted(current_fnames - signed_fnames):
+                    report.add(MISMATCH_ADDED, fname)
+                for fname in sorted(signed_fnames - current_fnames):
+                    report.add(MISMATCH_REMOVED, fname)
+            finally:
+                report.close()
             return {
                 "returncode": 1,
-                "stderr": "the following files are detected as differences.\nAdded: {}\nRemoved: {}".format(added, removed),
+                "stderr": "the following files are detected as differences.\nAdded: {}\nRemoved: {}".format(report.summary(MISMATCH_ADDED), report.summary(MISMATCH_REMOVED)),
+                "mismatch": report.to_dict(),
             }
         return {"returncode": 0, "stderr": ""}
 
@@ -84,31 +178,26 @@ class Digester:
 
     def digest_check(self, path):
         digest_file = os.path.join(path, DIGEST_FILENAME)
-        signed_digest_dict = {}
-        with open(digest_file, "r") as file:
-            for line in file:
+        signed_digest_dict = self.digest_file_to_digest_dict(digest_file)
+
+        filename_list = self.list_files_git(repo_path=path, ignore_prefix=DIGEST_FILENAME)
+        current_digest_list = self.calc_digest_for_fname_list(path, filename_list)
+        report = MismatchReport(self.report_limit, self.report_file)
+        try:
+            for line in current_digest_list:
                 parts = line.split(" ")
                 if len(parts) <= 1:
                     continue
                 digest = parts[0]
-                fname = " ".join(parts[1:]).replace("\n", "")
-                signed_digest_dict[fname] = digest
-
-        filename_list = self.list_files_git(repo_path=path, ignore_prefix=DIGEST_FILENAME)
-        current_digest_list = self.calc_digest_for_fname_list(path, filename_list)
-        diff_found_files = []
-        for line in current_digest_list:
-            parts = line.split(" ")
-            if len(parts) <= 1:
-                continue
-            digest = parts[0]
-            fname = " ".join(parts[1:])
-            signed_digest = signed_digest_dict.get(fname, "__not_found__")
-            if digest != signed_digest:
-                diff_found_files.append(fname)
-        if len(diff_found_files) > 0:
-            err_msg = "checksum failed: the following files were changed from the signed state: {}".format(diff_found_files)
-            return {"returncode": 1, "stderr": err_msg}
+                fname = " ".join(parts[1:])
+                signed_digest = signed_digest_dict.get(fname, "__not_found__")
+                if digest != signed_digest:
+                    report.add(MISMATCH_CHANGED, fname)
+        finally:
+            report.close()
+        if report.count() > 0:
+            err_msg = "checksum failed: {} files were changed from the signed state: {}".format(report.count(MISMATCH_CHANGED), report.summary(MISMATCH_CHANGED))
+            return {"returncode": 1, "stderr": err_msg, "mismatch": report.to_dict()}
         return {"returncode": 0, "stderr": ""}
 
     def gen_git(self, repo_path, filename=DIGEST_FILENAME):
@@ -123,19 +212,196 @@ class Digester:
         
         return {"returncode": 0}
 
+    def gen_bundle(self, bundle_path, path="", sigfile=SIGNATURE_FILENAME_GPG):
+        if path == "":
+            path = self.path
+        digest_file = os.path.join(path, DIGEST_FILENAME)
+        sig_file = os.path.join(path, sigfile)
+        for fpath in [digest_file, sig_file]:
+            if not os.path.exists(fpath):
+                return {"returncode": 1, "stderr": "No such file or directory: {}".format(fpath)}
+        # the digest file and the signature are placed at the head of the archive
+        # so that the signature can be checked before any other member is extracted
+        filename_list = self.list_files_git(repo_path=path, ignore_prefix=DIGEST_FILENAME)
+        try:
+            with tarfile.open(bundle_path, BUNDLE_MODE) as tar:
+                self.add_bundle_member(tar, digest_file, DIGEST_FILENAME)
+                self.add_bundle_member(tar, sig_file, sigfile)
+                for fname in filename_list:
+                    self.add_bundle_member(tar, os.path.join(path, fname), fname)
+        except:
+            return {"returncode": 1, "stderr": traceback.format_exc()}
+        return {"returncode": 0, "bundle": bundle_path, "num_files": len(filename_list)}
+
+    def add_bundle_member(self, tar, fpath, arcname):
+        # symlinks and hardlinks are stored as regular files with the same bytes that were hashed,
+        # because only regular files are accepted on extraction
+        with open(fpath, "rb") as file:
+            info = tar.gettarinfo(arcname=arcname, fileobj=file)
+            info.type = tarfile.REGTYPE
+            info.linkname = ""
+            info.size = os.fstat(file.fileno()).st_size
+            tar.addfile(info, file)
+
+    def extract_bundle(self, bundle_path, verify_func, path="", sigfile=SIGNATURE_FILENAME_GPG):
+        # verify_func receives a directory which contains the digest file and the signature,
+        # and returns a result dict with "failed" key
+        if path == "":
+            path = self.path
+        path = os.path.abspath(path)
+        self.reset_report_file()
+        if os.path.exists(path) and (not os.path.isdir(path) or len(os.listdir(path)) > 0):
+            return {"returncode": 1, "stderr": "the target directory must be empty or not exist: {}".format(path)}
+        # extract into a staging directory next to the target, and move it into place only on success
+        # so that a failed verification never leaves a partial tree in the target
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".{}.".format(os.path.basename(path)), dir=parent)
+        progress = {}
+        try:
+            try:
+                result = self.extract_bundle_to(bundle_path, verify_func, staging, sigfile, progress)
+            except (tarfile.TarError, EOFError, OSError) as e:
+                # a truncated or corrupted archive
+                result = {"returncode": 1, "stderr": "failed to read the bundle \"{}\": {}".format(bundle_path, e)}
+                result["verify_result"] = progress.get("verify_result", {"failed": True})
+            if result["returncode"] == 0:
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(staging, 0o777 & ~umask)
+                if os.path.exists(path):
+                    os.rmdir(path)
+                os.rename(staging, path)
+        finally:
+            if os.path.exists(staging):
+                shutil.rmtree(staging)
+        return result
+
+    def extract_bundle_to(self, bundle_path, verify_func, staging, sigfile, progress):
+        with tarfile.open(bundle_path, BUNDLE_STREAM_MODE) as tar:
+            for expected in [DIGEST_FILENAME, sigfile]:
+                member = tar.next()
+                if member is None or member.name != expected or not member.isfile():
+                    return {"returncode": 1, "stderr": "the bundle must start with \"{}\" and \"{}\"".format(DIGEST_FILENAME, sigfile)}
+                self.write_member(tar, member, os.path.join(staging, expected))
+            verify_result = verify_func(staging)
+            progress["verify_result"] = verify_result
+            if verify_result.get("failed", True):
+                return {"returncode": 1, "stderr": "signature verification failed", "verify_result": verify_result}
+            signed_digest_dict = self.digest_file_to_digest_dict(os.path.join(staging, DIGEST_FILENAME))
+
+            extracted = set()
+            # iterate with next() to keep reading from the current position of the stream
+            member = tar.next()
+            while member is not None:
+                fname = member.name
+                signed_digest = signed_digest_dict.get(fname, None)
+                unsafe = os.path.isabs(fname) or ".." in fname.split("/")
+                if signed_digest is None or unsafe or fname in extracted or not member.isfile():
+                    return {"returncode": 1, "stderr": "unexpected member in the bundle: {}".format(fname), "verify_result": verify_result}
+                digest = self.write_member(tar, member, os.path.join(staging, fname))
+                if digest != signed_digest:
+                    return {"returncode": 1, "stderr": "checksum failed: the following file was changed from the signed state: {}".format(fname), "verify_result": verify_result}
+                extracted.add(fname)
+                member = tar.next()
+        missing = set(signed_digest_dict.keys()) - extracted
+        if len(missing) > 0:
+            report = MismatchReport(self.report_limit, self.report_file)
+            try:
+                for fname in sorted(missing):
+                    report.add(MISMATCH_REMOVED, fname)
+            finally:
+                report.close()
+            err_msg = "the following files are missing in the bundle: {}".format(report.summary(MISMATCH_REMOVED))
+            return {"returncode": 1, "stderr": err_msg, "mismatch": report.to_dict(), "verify_result": verify_result}
+        return {"returncode": 0, "stderr": "", "verify_result": verify_result}
+
+    def write_member(self, tar, member, fpath):
+        # hash the member while writing it to disk, so the content is read only once
+        dname = os.path.dirname(fpath)
+        if dname != "":
+            os.makedirs(dname, exist_ok=True)
+        sha = hashlib.sha256()
+        src = tar.extractfile(member)
+        with open(fpath, "wb") as dst:
+            file_buffer = src.read(BLOCKSIZE)
+            while len(file_buffer) > 0:
+                sha.update(file_buffer)
+                dst.write(file_buffer)
+                file_buffer = src.read(BLOCKSIZE)
+        # keep the executable bits of scripts, but never setuid/setgid/sticky or group/other write
+        os.chmod(fpath, member.mode & 0o755)
+        return sha.hexdigest()
+
+    def digest_file_to_digest_dict(self, filename):
+        digest_dict = {}
+        with open(filename, "r") as file:
+            for line in file:
+                parts = line.split(" ")
+                if len(parts) <= 1:
+                    continue
+                digest = parts[0]
+                fname = " ".join(parts[1:]).replace("\n", "")
+                digest_dict[fname] = digest
+        return digest_dict
+
     def calc_digest_for_fname_list(self, path, fname_list):
-        digest_list = []
+        # files are read in the scheduled order, but the digest list is always
+        # returned in the order of fname_list to keep the digest file canonical
+        if self.io_schedule == IO_SCHEDULE_SORTED:
+            # the default: read in the given order without prefetch or fadvise hints
+            digest_list = []
+            for fname in fname_list:
+                with open(os.path.join(path, fname), "rb") as file:
+                    fdigest = self.calc_digest_for_file(file)
+                digest_list.append("{} {}".format(fdigest, fname))
+            return digest_list
+
+        digest_dict = {}
+        read_list = self.schedule_reads(path, fname_list)
+        # files in the prefetch window are opened ahead and hinted with WILLNEED,
+        # so the kernel reads them while the current file is hashed
+        window = collections.deque()
+        next_index = 0
+        try:
+            for _ in read_list:
+                while next_index < len(read_list) and len(window) <= self.prefetch:
+                    fname = read_list[next_index]
+                    file = open(os.path.join(path, fname), "rb")
+                    fadvise(file, "POSIX_FADV_WILLNEED")
+                    window.append((fname, file))
+                    next_index += 1
+                fname, file = window.popleft()
+                with file:
+                    fadvise(file, "POSIX_FADV_SEQUENTIAL")
+                    digest_dict[fname] = self.calc_digest_for_file(file)
+        finally:
+            # close the files left in the prefetch window when reading fails
+            for _, file in window:
+                file.close()
+        return ["{} {}".format(digest_dict[fname], fname) for fname in fname_list]
+
+    def calc_digest_for_file(self, file):
+        sha = hashlib.sha256()
+        file_buffer = file.read(BLOCKSIZE)
+        while len(file_buffer) > 0:
+            sha.update(file_buffer)
+            file_buffer = file.read(BLOCKSIZE)
+        return sha.hexdigest()
+
+    def schedule_reads(self, path, fname_list):
+        if self.io_schedule == IO_SCHEDULE_SORTED:
+            return fname_list
+        keys = {}
         for fname in fname_list:
             fpath = os.path.join(path, fname)
-            sha = hashlib.sha256()
-            with open(fpath, 'rb') as file:
-                file_buffer = file.read(BLOCKSIZE)
-                while len(file_buffer) > 0:
-                    sha.update(file_buffer)
-                    file_buffer = file.read(BLOCKSIZE)
-            fdigest = sha.hexdigest()
-            digest_list.append("{} {}".format(fdigest, fname))
-        return digest_list
+            st = os.stat(fpath)
+            physical = None
+            if self.io_schedule == IO_SCHEDULE_EXTENT:
+                physical = get_first_extent_offset(fpath)
+            # fall back to the inode number if the extent location is not available (e.g. NFS)
+            keys[fname] = (st.st_dev, 0 if physical is not None else 1, physical if physical is not None else st.st_ino)
+        return sorted(fname_list, key=lambda fname: keys[fname])
 
     def list_files_git(self, repo_path, ignore_prefix=DIGEST_FILENAME):
         repo = git.Repo(path=repo_path, search_parent_directories=True)
@@ -159,6 +425,45 @@ class Digester:
         filename_list = sorted(filename_list)
         return filename_list
 
+def get_signature_filename(signature_type):
+    if signature_type == SIGNATURE_TYPE_GPG:
+        return SIGNATURE_FILENAME_GPG
+    elif signature_type in [SIGNATURE_TYPE_SIGSTORE, SIGNATURE_TYPE_SIGSTORE_KEYLESS]:
+        return SIGNATURE_FILENAME_SIGSTORE
+    else:
+        raise ValueError("this signature type is not supported: {}".format(signature_type))
+
+def fadvise(file, advice):
+    # posix_fadvise is only a hint and is not available on every platform
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(file.fileno(), 0, 0, getattr(os, advice))
+    except OSError:
+        pass
+
+def get_first_extent_offset(fpath):
+    try:
+        import fcntl
+        header_size = struct.calcsize(FIEMAP_HEADER_FORMAT)
+        extent_size = struct.calcsize(FIEMAP_EXTENT_FORMAT)
+        # request only the first extent of the whole file
+        buf = bytearray(struct.pack(FIEMAP_HEADER_FORMAT, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(extent_size))
+        with open(fpath, "rb") as file:
+            fcntl.ioctl(file.fileno(), FS_IOC_FIEMAP, buf)
+    except (ImportError, OSError):
+        return None
+    mapped_extents = struct.unpack_from(FIEMAP_HEADER_FORMAT, buf)[3]
+    if mapped_extents == 0:
+        return None
+    extent = struct.unpack_from(FIEMAP_EXTENT_FORMAT, buf, header_size)
+    physical, flags = extent[1], extent[5]
+    # the physical offset is meaningless (usually 0) for delayed allocation, unknown location
+    # and inline data, so fall back to the inode number for such files
+    if flags & (FIEMAP_EXTENT_UNKNOWN | FIEMAP_EXTENT_DELALLOC | FIEMAP_EXTENT_DATA_INLINE) or physical == 0:
+        return None
+    return physical
+
 def result_object_to_dict(obj):
     if isinstance(obj, subprocess.CompletedProcess):
         failed = (obj.returncode != 0)
@@ -17,6 +17,10 @@ class Signer:
         self.keyid = params.get("keyid", None)
         self.passphrase = params.get("passphrase", None)
         self.keyless_signer_id = params.get("keyless_signer_id", "")
+        self.io_schedule = params.get("io_schedule", common.IO_SCHEDULE_SORTED)
+        self.bundle = params.get("bundle", "")
+        if self.bundle != "":
+            self.bundle = os.path.join(self.pwd, os.path.expanduser(self.bundle))
 
     def sign(self):
         result = {}
@@ -28,7 +32,7 @@ class Signer:
 
     def sign_playbook(self):
         result = {"failed": False}
-        digester = common.Digester(self.target)
+        digester = common.Digester(self.target, io_schedule=self.io_schedule)
         result["digest_result"] = digester.gen()
         if result["digest_result"]["returncode"] != 0:
             result["failed"] = True
@@ -48,6 +52,12 @@ class Signer:
         # set overall result
         if result["sign_result"].get("failed", True):
             result["failed"] = True
+            return result
+
+        if self.bundle != "":
+            result["bundle_result"] = digester.gen_bundle(self.bundle, sigfile=common.get_signature_filename(self.signature_type))
+            if result["bundle_result"]["returncode"] != 0:
+                result["failed"] = True
         return result
 
     def sign_gpg(self, path, msgfile, sigfile, private_key, keyid=None, passphrase=None):
@@ -0,0 +1,240 @@
+import os
+import json
+import base64
+import hashlib
+import tempfile
+import gnupg
+
+TRUST_STORE_CACHE_DIRNAME = "playbook-integrity/trust_store"
+
+KEY_TYPE_GPG = "gpg"
+KEY_TYPE_SIGSTORE = "sigstore"
+
+PEM_PUBLIC_KEY_HEADER = "-----BEGIN PUBLIC KEY-----"
+PEM_PUBLIC_KEY_FOOTER = "-----END PUBLIC KEY-----"
+
+OPENPGP_PACKET_TAG_SIGNATURE = 2
+OPENPGP_SUBPACKET_ISSUER = 16
+OPENPGP_SUBPACKET_ISSUER_FINGERPRINT = 33
+
+
+class TrustStore:
+    # a directory of GPG / cosign public keys indexed by key ID and fingerprint.
+    # the index is cached in the user cache directory (keyed by the trust store path),
+    # so the trust store itself can be read-only. while the directory is unchanged,
+    # a lookup costs one stat of the directory and one read of the cached index.
+    def __init__(self, path, cache_dir=""):
+        self.path = os.path.abspath(path)
+        if cache_dir == "":
+            cache_dir = get_default_cache_dir()
+        self.index_path = os.path.join(cache_dir, hashlib.sha256(self.path.encode()).hexdigest() + ".json")
+        self.warnings = []
+        index = self.load_index()
+        self.key_index = index["keys"]
+        self.warnings.extend(index["collisions"])
+
+    def find_key(self, key_type, keyids):
+        for keyid in keyids:
+            fname = self.key_index.get("{}:{}".format(key_type, keyid.upper()), None)
+            if fname is not None:
+                return os.path.join(self.path, fname)
+        return None
+
+    def build_key_index(self, files):
+        keys = {}
+        collisions = []
+        for fname, entry in sorted(files.items()):
+            for keyid in entry["ids"]:
+                key = "{}:{}".format(entry["type"], keyid)
+                if key in keys and keys[key] != fname:
+                    collisions.append("the key ID {} is found in both \"{}\" and \"{}\" in the trust store; \"{}\" is used".format(keyid, keys[key], fname, fname))
+                keys[key] = fname
+        return keys, collisions
+
+    def load_index(self):
+        cached = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                cached = {}
+
+        # adding, removing or replacing a key file changes the directory stamp,
+        # so the key files are listed and checked only when the directory has changed
+        dir_stamp = file_stamp(self.path)
+        if cached.get("stamp", None) == dir_stamp and "keys" in cached:
+            return cached
+
+        cached_files = cached.get("files", {})
+        files = {}
+        for fname in sorted(os.listdir(self.path)):
+            fpath = os.path.join(self.path, fname)
+            if not os.path.isfile(fpath):
+                continue
+            stamp = file_stamp(fpath)
+            entry = cached_files.get(fname, None)
+            if entry is None or entry.get("stamp", None) != stamp:
+                # only new or modified key files are scanned
+                entry = self.scan_key_file(fpath)
+                entry["stamp"] = stamp
+            files[fname] = entry
+        keys, collisions = self.build_key_index(files)
+        index = {"stamp": dir_stamp, "files": files, "keys": keys, "collisions": collisions}
+        self.save_index(index)
+        return index
+
+    def save_index(self, index):
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            temp_path = "{}.{}.tmp".format(self.index_path, os.getpid())
+            with open(temp_path, "w") as f:
+                json.dump(index, f)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            # the index is still usable in memory, but the directory will be checked again on the next call
+            self.warnings.append("failed to save the trust store index to \"{}\": {}".format(self.index_path, e))
+
+    def scan_key_file(self, fpath):
+        with open(fpath, "rb") as f:
+            data = f.read()
+        if PEM_PUBLIC_KEY_HEADER.encode() in data:
+            ids = [pem_public_key_id(data.decode()), os.path.splitext(os.path.basename(fpath))[0].upper()]
+            return {"type": KEY_TYPE_SIGSTORE, "ids": ids}
+
+        ids = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            gpg = gnupg.GPG(gnupghome=temp_dir)
+            for key in gpg.scan_keys(fpath):
+                ids.append(key["keyid"].upper())
+                ids.append(key["fingerprint"].upper())
+                for subkey in key.get("subkeys", []):
+                    ids.append(subkey[0].upper())
+                    if len(subkey) > 2 and subkey[2]:
+                        ids.append(subkey[2].upper())
+        if len(ids) == 0:
+            return {"type": "", "ids": []}
+        return {"type": KEY_TYPE_GPG, "ids": ids}
+
+
+def get_default_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME", "")
+    if cache_home == "":
+        cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, TRUST_STORE_CACHE_DIRNAME)
+
+
+def file_stamp(fpath):
+    # a key file is scanned again when any of these changes
+    st = os.stat(fpath)
+    return [st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns]
+
+
+def pem_public_key_id(pem):
+    # the key ID of a cosign public key is the SHA-256 digest of the DER encoded key
+    body = pem.split(PEM_PUBLIC_KEY_HEADER, 1)[1].split(PEM_PUBLIC_KEY_FOOTER, 1)[0]
+    der = base64.b64decode("".join(body.split()))
+    return hashlib.sha256(der).hexdigest().upper()
+
+
+def read_gpg_signature_issuer(sigpath):
+    with open(sigpath, "rb") as f:
+        data = f.read()
+    if data.lstrip().startswith(b"-----BEGIN PGP SIGNATURE-----"):
+        data = dearmor(data.decode())
+    issuers = []
+    pos = 0
+    while pos < len(data):
+        tag, body, pos = read_openpgp_packet(data, pos)
+        if tag == OPENPGP_PACKET_TAG_SIGNATURE:
+            issuers.extend(read_signature_packet_issuer(body))
+    # prefer the fingerprint over the 64-bit key ID
+    return sorted(set(issuers), key=lambda x: -len(x))
+
+
+def dearmor(text):
+    lines = text.strip().splitlines()
+    body = []
+    in_header = True
+    for line in lines[1:]:
+        if line.startswith("-----END"):
+            break
+        if in_header:
+            # armor headers such as "Version:" end with an empty line
+            if line.strip() == "":
+                in_header = False
+            elif ":" not in line:
+                in_header = False
+                body.append(line)
+            continue
+        if line.startswith("="):
+            # CRC24 checksum line
+            break
+        body.append(line)
+    return base64.b64decode("".join(body))
+
+
+def read_openpgp_packet(data, pos):
+    ctb = data[pos]
+    if ctb & 0x80 == 0:
+        raise ValueError("invalid OpenPGP packet at offset {}".format(pos))
+    if ctb & 0x40:
+        # new format packet
+        tag = ctb & 0x3f
+        first = data[pos + 1]
+        if first < 192:
+            length, pos = first, pos + 2
+        elif first < 224:
+            length, pos = ((first - 192) << 8) + data[pos + 2] + 192, pos + 3
+        elif first == 255:
+            length, pos = int.from_bytes(data[pos + 2:pos + 6], "big"), pos + 6
+        else:
+            raise ValueError("partial body length is not supported in signature packets")
+    else:
+        # old format packet
+        tag = (ctb >> 2) & 0x0f
+        length_type = ctb & 0x03
+        if length_type == 3:
+            length, pos = len(data) - pos - 1, pos + 1
+        else:
+            size = 1 << length_type
+            length, pos = int.from_bytes(data[pos + 1:pos + 1 + size], "big"), pos + 1 + size
+    return tag, data[pos:pos + length], pos + length
+
+
+def read_signature_packet_issuer(body):
+    version = body[0]
+    if version == 3:
+        return [body[7:15].hex().upper()]
+    if version != 4:
+        return []
+    issuers = []
+    pos = 4
+    for _ in range(2):
+        # hashed subpackets, then unhashed subpackets
+        size = int.from_bytes(body[pos:pos + 2], "big")
+        issuers.extend(read_signature_subpacket_issuer(body[pos + 2:pos + 2 + size]))
+        pos += 2 + size
+    return issuers
+
+
+def read_signature_subpacket_issuer(data):
+    issuers = []
+    pos = 0
+    while pos < len(data):
+        first = data[pos]
+        if first < 192:
+            length, pos = first, pos + 1
+        elif first < 255:
+            length, pos = ((first - 192) << 8) + data[pos + 1] + 192, pos + 2
+        else:
+            length, pos = int.from_bytes(data[pos + 1:pos + 5], "big"), pos + 5
+        subtype = data[pos] & 0x7f
+        value = data[pos + 1:pos + length]
+        if subtype == OPENPGP_SUBPACKET_ISSUER:
+            issuers.append(value.hex().upper())
+        elif subtype == OPENPGP_SUBPACKET_ISSUER_FINGERPRINT:
+            # the first octet is the key version
+            issuers.append(value[1:].hex().upper())
+        pos += length
+    return issuers
@@ -3,19 +3,38 @@ import os
 import tempfile
 import gnupg
 import ansible_collections.playbook.integrity.plugins.module_utils.common as common
+from ansible_collections.playbook.integrity.plugins.module_utils.trust_store import TrustStore, read_gpg_signature_issuer, KEY_TYPE_GPG, KEY_TYPE_SIGSTORE
 
 
 class Verifier:
     def __init__(self, params):
         self.pwd = params.get("pwd", "")
         self.type = params.get("type", "")
-        self.target = params.get("target", "")
-        self.target = common.validate_path(self.pwd, params.get("target", ""))
+        self.bundle = params.get("bundle", "")
+        if self.bundle != "":
+            self.bundle = common.validate_path(self.pwd, self.bundle)
+            # the target is the directory where the bundle is extracted, so it may not exist yet
+            self.target = os.path.join(self.pwd, os.path.expanduser(params.get("target", "")))
+        else:
+            self.target = common.validate_path(self.pwd, params.get("target", ""))
         self.signature_type = params.get("signature_type", "gpg")
         self.public_key = params.get("public_key", "")
         if self.public_key != "":
             self.public_key = common.validate_path(self.pwd, self.public_key)
         self.keyless_signer_id = params.get("keyless_signer_id", "")
+        self.keyid = params.get("keyid", "")
+        self.report_limit = params.get("report_limit", common.DEFAULT_REPORT_LIMIT)
+        self.io_schedule = params.get("io_schedule", common.IO_SCHEDULE_SORTED)
+        self.report_file = params.get("report_file", "")
+        if self.report_file != "":
+            self.report_file = os.path.join(self.pwd, os.path.expanduser(self.report_file))
+        self.trust_store = params.get("trust_store", "")
+        if self.trust_store != "":
+            self.trust_store = common.validate_path(self.pwd, self.trust_store)
+        self.trust_store_warnings = []
+        self.trust_store_cache = params.get("trust_store_cache", "")
+        if self.trust_store_cache != "":
+            self.trust_store_cache = os.path.join(self.pwd, os.path.expanduser(self.trust_store_cache))
 
     def verify(self):
         result = {}
@@ -26,29 +45,71 @@ class Verifier:
         return result
 
     def verify_playbook(self):
+        if self.bundle != "":
+            return self.verify_bundle()
+
         result = {"failed": False}
-        digester = common.Digester(self.target)
+        digester = common.Digester(self.target, report_limit=self.report_limit, report_file=self.report_file, io_schedule=self.io_schedule)
         result["digest_result"] = digester.check()
         if result["digest_result"]["returncode"] != 0:
             result["failed"] = True
             return result
 
+        result["verify_result"] = self.verify_signature(self.target)
+        if len(self.trust_store_warnings) > 0:
+            result["warnings"] = self.trust_store_warnings
+        # set overall result
+        if result["verify_result"].get("failed", True):
+            result["failed"] = True
+        return result
+
+    def verify_bundle(self):
+        # the signature is verified first, and then each file is hashed while it is extracted
+        result = {"failed": False}
+        digester = common.Digester(self.target, report_limit=self.report_limit, report_file=self.report_file, io_schedule=self.io_schedule)
+        digest_result = digester.extract_bundle(self.bundle, self.verify_signature, sigfile=common.get_signature_filename(self.signature_type))
+        result["verify_result"] = digest_result.pop("verify_result", {"failed": True})
+        result["digest_result"] = digest_result
+        if len(self.trust_store_warnings) > 0:
+            result["warnings"] = self.trust_store_warnings
+        if digest_result["returncode"] != 0 or result["verify_result"].get("failed", True):
+            result["failed"] = True
+        return result
+
+    def verify_signature(self, path):
+        result = None
         if self.signature_type == common.SIGNATURE_TYPE_GPG:
-            result["verify_result"] = self.verify_gpg(self.target, common.DIGEST_FILENAME, common.SIGNATURE_FILENAME_GPG, self.public_key)
+            public_key = self.public_key
+            if public_key == "" and self.trust_store != "":
+                keyids = read_gpg_signature_issuer(os.path.join(path, common.SIGNATURE_FILENAME_GPG))
+                public_key = self.get_trust_store().find_key(KEY_TYPE_GPG, keyids)
+                if public_key is None:
+                    return {"failed": True, "returncode": 1, "stderr": "no trusted GPG key found in the trust store for the key ID {}".format(keyids)}
+            result = self.verify_gpg(path, common.DIGEST_FILENAME, common.SIGNATURE_FILENAME_GPG, public_key)
         elif self.signature_type in [common.SIGNATURE_TYPE_SIGSTORE, common.SIGNATURE_TYPE_SIGSTORE_KEYLESS]:
             keyless = True if self.signature_type == common.SIGNATURE_TYPE_SIGSTORE_KEYLESS else False
             type = common.SIGSTORE_TARGET_TYPE_FILE
-            result["verify_result"] = self.verify_sigstore(self.target, common.DIGEST_FILENAME, common.SIGNATURE_FILENAME_SIGSTORE, self.public_key, keyless, type)
+            public_key = self.public_key
+            if public_key == "" and self.trust_store != "" and not keyless:
+                # cosign signatures do not carry the key ID, so it must be specified
+                if self.keyid == "":
+                    raise ValueError("\"keyid\" is required to verify a sigstore signature with the trust store")
+                public_key = self.get_trust_store().find_key(KEY_TYPE_SIGSTORE, [self.keyid])
+                if public_key is None:
+                    return {"failed": True, "returncode": 1, "stderr": "no trusted cosign key found in the trust store for the key ID {}".format(self.keyid)}
+            result = self.verify_sigstore(path, common.DIGEST_FILENAME, common.SIGNATURE_FILENAME_SIGSTORE, public_key, keyless, type)
         else:
             raise ValueError("this signature type is not supported: {}".format(self.signature_type))
-        # set overall result
-        if result["verify_result"].get("failed", True):
-            result["failed"] = True
         return result
 
+    def get_trust_store(self):
+        trust_store = TrustStore(self.trust_store, cache_dir=self.trust_store_cache)
+        self.trust_store_warnings = trust_store.warnings
+        return trust_store
+
     def verify_gpg(self, path, msgfile, sigfile, public_key):
         use_gpg_default_key = False
-        if self.public_key == "":
+        if public_key == "":
             use_gpg_default_key = True
 
         if not os.path.exists(path):
@@ -65,7 +126,9 @@ class Verifier:
             result = gpg.verify_file(file=open(sigpath, "rb"), data_filename=msgpath)
         else:
             with tempfile.TemporaryDirectory() as dname:
-                gpg = gnupg.GPG(gnupghome=dname, keyring=self.public_key)
+                # import the key into the temp gnupg home instead of using the key file as a keyring,
+                # so that ASCII-armored keys work and the key file is never modified by gpg
+                gpg = gnupg.GPG(gnupghome=dname)
                 try:
                     gpg.import_keys(open(public_key, "r").read())
                 except:
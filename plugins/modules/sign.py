@@ -50,6 +50,18 @@ options:
         - A signer id of keyless singing. If specified, the signed entity can be verified without specifying signer id. Only when "signature_type" is "sigstore_keyless"
         required: false
         type: str
+    io_schedule:
+        description:
+        - The order in which files are read for hashing. ["sorted"/"inode"/"extent"]
+        - "inode" and "extent" order the reads by inode number or by the physical location of the first extent, which reduces random I/O on spinning disks and network filesystems. The digest file is always written in sorted order.
+        - default: "sorted"
+        required: false
+        type: str
+    bundle:
+        description:
+        - A path to a signed bundle archive (tar.gz) to be created. If specified, the committed files, the digest file and the signature are packed into this archive after signing.
+        required: false
+        type: str
     
 # Specify this value according to your collection
 # in format of namespace.collection.doc_fragment_name
@@ -66,6 +78,13 @@ EXAMPLES = r'''
   playbook.integrity.sign:
     type: playbook
     target: path/to/playbookrepo
+
+# Sign a playbook SCM repo and pack it into a signed bundle
+- name: Sign a playbook SCM repo and create a bundle
+  playbook.integrity.sign:
+    type: playbook
+    target: path/to/playbookrepo
+    bundle: path/to/playbookrepo.tar.gz
 '''
 
 RETURN = r'''
@@ -97,6 +116,8 @@ def run_module():
         keyid=dict(type='str', required=False, default=""),
         passphrase=dict(type='str', required=False, default=""),
         keyless_signer_id=dict(type='str', required=False, default=""),
+        io_schedule=dict(type='str', required=False, default="sorted"),
+        bundle=dict(type='str', required=False, default=""),
     )
 
     # seed the result dict in the object
@@ -45,6 +45,50 @@ options:
         - A signer id of keyless verification. If specified, the signer id of the provided signature must match with this. Only when "signature_type" is "sigstore_keyless"
         required: false
         type: str
+    trust_store:
+        description:
+        - A path to a directory of trusted GPG and cosign public keys. If specified and "public_key" is empty, only the key matching the signature is loaded.
+        - For "gpg", the key is selected by the issuer key ID in the signature. For "sigstore", the key is selected by "keyid".
+        - If the same key ID is found in several key files, the last file in name order is used and a warning is returned.
+        required: false
+        type: str
+    trust_store_cache:
+        description:
+        - A directory to cache the key index of "trust_store". The trust store itself can be read-only.
+        - The index is rebuilt when the trust store directory changes (a key file is added, removed or replaced). Replace key files instead of editing them in place.
+        - default: "$XDG_CACHE_HOME/playbook-integrity/trust_store" or "~/.cache/playbook-integrity/trust_store"
+        required: false
+        type: str
+    keyid:
+        description:
+        - A key ID to select a cosign public key from "trust_store". The SHA-256 digest of the DER encoded public key, or the key file name without extension. Only when "signature_type" is "sigstore"
+        required: false
+        type: str
+    report_limit:
+        description:
+        - The maximum number of paths reported per mismatch category ("added"/"removed"/"changed"). The total counts are always reported.
+        - default: 20
+        required: false
+        type: int
+    report_file:
+        description:
+        - A path to a JSON-lines file on the target host. If specified, every mismatched path is written to this file.
+        - The file is truncated at the start of every verification, so it is empty when no mismatch is found.
+        required: false
+        type: str
+    io_schedule:
+        description:
+        - The order in which files are read for hashing. ["sorted"/"inode"/"extent"]
+        - "inode" and "extent" order the reads by inode number or by the physical location of the first extent, which reduces random I/O on spinning disks and network filesystems. The digest file is always written in sorted order.
+        - default: "sorted"
+        required: false
+        type: str
+    bundle:
+        description:
+        - A path to a signed bundle archive created by the sign module. If specified, the signature is verified first, and then each file is hashed while it is extracted into "target". Verification aborts on the first mismatch.
+        - The files are extracted into a staging directory and moved to "target" only when the verification succeeds, so "target" must be empty or not exist.
+        required: false
+        type: str
     
 # Specify this value according to your collection
 # in format of namespace.collection.doc_fragment_name
@@ -61,6 +105,20 @@ EXAMPLES = r'''
   playbook.integrity.verify:
     type: playbook
     target: path/to/playbookrepo
+
+# Verify a playbook SCM repo with the key selected from a trust store
+- name: Verify a playbook SCM repo with a trust store
+  playbook.integrity.verify:
+    type: playbook
+    target: path/to/playbookrepo
+    trust_store: path/to/trusted/keys
+
+# Verify a signed bundle and extract it
+- name: Verify a signed bundle and extract it
+  playbook.integrity.verify:
+    type: playbook
+    target: path/to/extract/dir
+    bundle: path/to/playbookrepo.tar.gz
 '''
 
 RETURN = r'''
@@ -90,6 +148,13 @@ def run_module():
         signature_type=dict(type='str', required=False, default="gpg"),
         public_key=dict(type='str', required=False, default=""),
         keyless_signer_id=dict(type='str', required=False, default=""),
+        trust_store=dict(type='str', required=False, default=""),
+        trust_store_cache=dict(type='str', required=False, default=""),
+        keyid=dict(type='str', required=False, default=""),
+        report_limit=dict(type='int', required=False, default=20),
+        report_file=dict(type='str', required=False, default=""),
+        io_schedule=dict(type='str', required=False, default="sorted"),
+        bundle=dict(type='str', required=False, default=""),
         action=dict(type='str', required=False, default="fail")
     )
 
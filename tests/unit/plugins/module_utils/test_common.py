@@ -0,0 +1,60 @@
+import os
+import tarfile
+import ansible_collections.playbook.integrity.plugins.module_utils.common as common
+
+
+def make_repo(path):
+    os.makedirs(os.path.join(path, "sub"))
+    with open(os.path.join(path, "a.txt"), "w") as f:
+        f.write("a\n")
+    with open(os.path.join(path, "sub", "run.sh"), "w") as f:
+        f.write("#!/bin/sh\n")
+    os.chmod(os.path.join(path, "sub", "run.sh"), 0o755)
+    os.symlink("sub/run.sh", os.path.join(path, "link.sh"))
+    os.link(os.path.join(path, "a.txt"), os.path.join(path, "b.txt"))
+    return ["a.txt", "b.txt", "link.sh", "sub/run.sh"]
+
+
+def sign_bundle(monkeypatch, tmp_path):
+    repo = str(tmp_path / "repo")
+    fname_list = make_repo(repo)
+    # list the files as git does, including the symlink, regardless of the cwd
+    monkeypatch.setattr(common.Digester, "list_files_git", lambda self, repo_path, ignore_prefix=common.DIGEST_FILENAME: fname_list)
+    digester = common.Digester(repo)
+    assert digester.gen()["returncode"] == 0
+    with open(os.path.join(repo, common.SIGNATURE_FILENAME_GPG), "w") as f:
+        f.write("signature")
+    bundle = str(tmp_path / "bundle.tar.gz")
+    assert digester.gen_bundle(bundle)["returncode"] == 0
+    return repo, bundle
+
+
+def verify_ok(path):
+    return {"failed": False}
+
+
+def test_bundle_with_symlink_and_hardlink(monkeypatch, tmp_path):
+    repo, bundle = sign_bundle(monkeypatch, tmp_path)
+    with tarfile.open(bundle) as tar:
+        assert all(member.isfile() for member in tar.getmembers())
+
+    target = str(tmp_path / "out")
+    result = common.Digester(target).extract_bundle(bundle, verify_ok)
+    assert result["returncode"] == 0, result["stderr"]
+    for fname in ["b.txt", "link.sh"]:
+        with open(os.path.join(target, fname)) as f1, open(os.path.join(repo, fname)) as f2:
+            assert f1.read() == f2.read()
+    assert os.stat(os.path.join(target, "sub", "run.sh")).st_mode & 0o777 == 0o755
+
+
+def test_bundle_truncated(monkeypatch, tmp_path):
+    _, bundle = sign_bundle(monkeypatch, tmp_path)
+    truncated = str(tmp_path / "truncated.tar.gz")
+    with open(bundle, "rb") as src, open(truncated, "wb") as dst:
+        dst.write(src.read()[:200])
+
+    target = str(tmp_path / "out")
+    result = common.Digester(target).extract_bundle(truncated, verify_ok)
+    assert result["returncode"] == 1
+    assert "failed to read the bundle" in result["stderr"]
+    assert not os.path.exists(target)